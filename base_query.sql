@@ -3,13 +3,13 @@ select cards.cardname,
 	   case
 	       when deck_lists.cardname is null then 0
 	       else count(*)
-	   end as [total],
+	   end as totaldecks,
+	   avg(coalesce(deck_lists.amount, 0)) as avgperdeck,
 	   case
 	       when deck_lists.cardname is null then 0.0
 		   else count(*)/(select cast(count(*) as double) from decks) * 100.0
-	   end as [percent],
-	   avg(coalesce(deck_lists.amount, 0)) as [per deck],
-	   coalesce(collection.amount, 0) as collected
+	   end as percentdecks,
+	   coalesce(collection.amount, 0) as incollection
 from cards
 left join deck_lists
 on cards.cardname = deck_lists.cardname
@@ -20,4 +20,4 @@ where cards.cardset in ('Classic',
                         'Mean Streets of Gadgetzan',
 						'Journey to Un''Goro')
 group by cards.cardname
-order by Total desc
\ No newline at end of file
+order by totaldecks desc
\ No newline at end of file
@@ -1,18 +1,95 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from lxml import html
 from pathlib import Path
 import argparse
+import array
+import ast
+import base64
+import collections
 import configparser
+import csv
 import json
 import math
+import mmap
+import os
+import queue
 import requests
 import re
+import shutil
 import sqlite3
 import sys
+import threading
+import time
 
 # Constants
 DECKS_PER_PAGE = 25.0
+PREFETCH_PAGES = 4
+# Number of decks whose card lists are fetched at the same time by --jobs.
+DECK_LIST_WORKERS = 4
+DATABASE = 'hearth.db'
+SNAPSHOT_DIR = 'snapshot'
+SNAPSHOT_TABLES = ('decks', 'deck_lists', 'cards')
+# NumPy dtypes for snapshot columns. Text columns are stored as indexes into
+# the snapshot's list of strings.
+SNAPSHOT_TYPES = {'integer': '<i8', 'text': '<i4'}
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# Settings that can be used in each section of a --jobs file.
+JOB_OPTIONS = ('filtering', 'sorting', 'patch', 'count', 'perclass')
+# Dust needed to craft one copy of a card, by rarity.
+CRAFTING_COSTS = {'Free': 0, 'Common': 40, 'Rare': 100,
+                  'Epic': 400, 'Legendary': 1600}
+CARD_PERCENTAGES_SQL = '''
+            select cards.cardname,
+                    cards.hero,
+                    case
+                        when deck_lists.cardname is null then 0
+                        else count(*)
+                    end as totaldecks,
+                    avg(coalesce(deck_lists.amount, 0)) as avgperdeck,
+                    case
+                        when deck_lists.cardname is null then 0.0
+                        else count(*) /
+                        (select cast(count(*) as double) from decks) * 100.0
+                    end as percentdecks,
+                    coalesce(collection.amount, 0) as incollection
+            from cards
+            left join deck_lists
+            on cards.cardname = deck_lists.cardname
+            left join collection
+            on cards.cardname = collection.cardname
+            where cards.cardset in ('Classic',
+                                    'Whispers of the Old Gods',
+                                    'Mean Streets of Gadgetzan',
+                                    'Journey to Un''Goro')
+            group by cards.cardname
+            order by totaldecks desc
+            '''
+CRAFTABILITY_SQL = '''
+            select decks.deckid,
+                   decks.class as hero,
+                   decks.type,
+                   decks.rating,
+                   decks.dust,
+                   craftability.missingcards,
+                   craftability.missingdust,
+                   craftability.unknowncards
+            from craftability
+            join decks
+            on craftability.deckid = decks.deckid
+            order by craftability.unknowncards > 0,
+                     craftability.missingdust,
+                     craftability.missingcards,
+                     decks.rating desc
+            '''
+# Queries that can be exported by name with --export, as well as any table.
+EXPORT_QUERIES = {'results': CARD_PERCENTAGES_SQL,
+                  'craftable': CRAFTABILITY_SQL}
+EXPORT_FORMATS = ('csv', 'jsonl', 'sqlite')
+EXPORT_CHUNK_ROWS = 10000
+EXPORT_BUFFER_SIZE = 1024 * 1024
 
 
 class Deck:
@@ -94,25 +171,36 @@ class Card:
 
 
 def main():
-    print("Loading Argument Parser")
     argparser = build_argparser()
     args = argparser.parse_args()
+    exportstdout = sys.stdout
+    if (args.export or args.query) and args.output == '-':
+        if args.format == 'sqlite':
+            print('ERROR: --format sqlite can\'t be written to stdout, use'
+                  ' --output to name a database file')
+            sys.exit(-1)
+        # The exported rows are written to stdout, so status messages are
+        # moved to stderr to keep them out of the export.
+        sys.stdout = sys.stderr
     print("Argument Parser Loaded")
     print("Loading Config Parser")
     config = build_configparser()
     print("Config Parser Loaded")
     operselected = (args.builddecks or args.buildcards or
-                    args.buildcollection or args.results)
+                    args.buildcollection or args.results or args.serve or
+                    args.craftable or args.snapshot or args.jobs or
+                    args.export or args.query)
     if not operselected:
         # TODO: Swap to actual Python error/exception handling?
         print('ERROR: You must use --builddecks, --buildcards,'
-              ' and/or --buildcollection')
+              ' --buildcollection, --jobs, --results, --craftable,'
+              ' --export, --query, --snapshot, and/or --serve')
         argparser.print_help()
         sys.exit(-1)
     mashape_key = config['Configuration']['MashapeKey']
     auth_session = config['Configuration']['AuthSession']
     print("Connecting to SQLite3")
-    conn = sqlite3.connect('hearth.db')
+    conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
     print("SQLite3 Connected")
 
@@ -135,11 +223,31 @@ def main():
                               args.count, args.patch)
         populate_deck_db(decks, cursor)
 
-    dbchanged = (args.buildcards or args.builddecks or args.buildcollection)
+    if args.jobs:
+        print("Running jobs from " + args.jobs + "...")
+        run_jobs(read_jobs(args.jobs), cursor)
+
+    if args.craftable:
+        print("Building craftability database...")
+        try:
+            populate_craftability_db(cursor)
+        except sqlite3.OperationalError as error:
+            print('Unable to build craftability database: ' + str(error))
+            print('Decks, cards, and collection must be built first.')
+            sys.exit(-1)
+
+    dbchanged = (args.buildcards or args.builddecks or args.buildcollection or
+                 args.craftable or args.jobs)
     if dbchanged:
         print("Committing changes")
         conn.commit()
 
+    if args.builddecks or args.buildcards or args.snapshot:
+        # Rebuilt after every deck or card build so the snapshot never lags
+        # behind the database.
+        print("Exporting snapshot to " + SNAPSHOT_DIR + "...")
+        export_snapshot(cursor, SNAPSHOT_DIR)
+
     if args.results:
         # TODO: More options when displaying results. For now, for anything
         # other than the default has to be queried from the DB directly.
@@ -151,7 +259,45 @@ def main():
                 print("{0}, {1}, {2}, {3:0.2f}, {4:0.2f}%, {5}"
                       .format(row[0], row[1], row[2], row[3], row[4], row[5]))
 
+    if args.craftable:
+        results = get_db_craftability(cursor)
+        print("deckid, hero, type, rating, dust, missingcards, missingdust, "
+              "unknowncards")
+        for row in results:
+            print("{0}, {1}, {2}, {3}, {4}, {5}, {6}, {7}"
+                  .format(row[0], row[1], row[2], row[3], row[4], row[5],
+                          row[6], row[7]))
+
+    if args.export or args.query:
+        if args.query:
+            name, sql = 'query', args.query
+        else:
+            name, sql = args.export, get_export_sql(cursor, args.export)
+        output = args.output
+        if not output:
+            output = name + '.' + ('db' if args.format == 'sqlite'
+                                   else args.format)
+        print("Exporting " + name + " to " + output + "...")
+        if output == '-':
+            output = exportstdout
+        try:
+            if args.format == 'sqlite':
+                rowcount = export_to_sqlite(cursor, sql, output, name)
+            else:
+                rowcount = export_to_file(cursor, sql, output, args.format)
+        except (sqlite3.OperationalError, sqlite3.ProgrammingError,
+                OSError, TypeError) as error:
+            print('Unable to export ' + name + ': ' + str(error))
+            sys.exit(-1)
+        print("Exported " + str(rowcount) + " rows")
+
     conn.close()
+
+    if args.serve:
+        # Started last so that any builds requested alongside --serve are
+        # committed before the first request is answered.
+        serve_stats(DATABASE, args.port)
+
     print('Complete!')
 
 
@@ -172,6 +318,10 @@ def build_argparser():
                         help='build deck database from HearthPwn')
     parser.add_argument('--buildcollection', action='store_true',
                         help='build personal card collection from Hearthpwn')
+    parser.add_argument('--jobs', metavar='JOBFILE',
+                        help='build deck databases for every job in an INI '
+                             'style job file, storing each job\'s decks in '
+                             'the decks_<job> and deck_lists_<job> tables')
     # TODO: Possibly make this just a value passed in for --builddecks?
     parser.add_argument('--perclass', action='store_true',
                         help='get the same number of decks for each class')
@@ -195,9 +345,41 @@ def build_argparser():
                              'cardname, '
                              'hero (or neutral), '
                              'total count of decks using the card, '
-                             'percentage of decks using the card, '
                              'average count of the card in decks using it, '
+                             'percentage of decks using the card, '
                              'and the count of the card in your collection.')
+    parser.add_argument('--craftable', action='store_true',
+                        help='for all decks, compute and display (in a '
+                             'CSV-ish format) the number of cards and the '
+                             'dust missing from your collection to build '
+                             'the deck, cheapest first. Decks missing cards '
+                             'that can\'t be priced are listed last.')
+    exportgroup = parser.add_mutually_exclusive_group()
+    exportgroup.add_argument('--export', metavar='SOURCE',
+                             help='export a table, or one of the named '
+                                  'queries (' + ', '.join(EXPORT_QUERIES) +
+                                  '), from the database')
+    exportgroup.add_argument('--query', metavar='SQL',
+                             help='export the results of a SQL query on the '
+                                  'database')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv',
+                        help='the format used by --export and --query. '
+                             'sqlite copies the rows into a table in '
+                             'another SQLite database (default: csv)')
+    parser.add_argument('--output',
+                        help='the file written by --export and --query, or '
+                             '- for stdout with csv and jsonl (default: '
+                             'SOURCE.FORMAT)')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='export the decks, deck lists, and cards '
+                             'tables to a columnar snapshot (done '
+                             'automatically by --builddecks and '
+                             '--buildcards)')
+    parser.add_argument('--serve', action='store_true',
+                        help='serve card statistics, deck lookups, and '
+                             'class breakdowns as JSON over HTTP')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='the port used by --serve (default: 8080)')
     return parser
 
 
@@ -256,23 +438,47 @@ def get_decks_per_class(filtering=None, sorting=None, count=None, patch=None):
     - 'patch' - the HearthPwn patch ID used when finding decks, as seen in the
     HearthPwn URL after "&filter-build="
     """
+    return get_decks_from_metainfo(
+        get_deck_metainfo_per_class(filtering, sorting, count, patch))
+
+
+def get_deck_metainfo_per_class(filtering=None, sorting=None, count=None,
+                                patch=None, cache=None):
+    """
+    Gets a list of (links, classes, types, ratings, dusts, epochs)
+    from HearthPwn using the provided paramters, ensuring the same number of
+    decks are retrieved for each class.
+
+    Parameters:
+
+    - 'filtering' - the HearthPwn filter used when finding decks, as seen in
+    the HearthPwn URL
+    - 'sorting' - the HearthPwn sorting used when finding decks, as seen in the
+    HearthPwn URL after "&sort="
+    - 'count' - number of decks to retrieve
+    - 'patch' - the HearthPwn patch ID used when finding decks, as seen in the
+    HearthPwn URL after "&filter-build="
+    - 'cache' - an optional dict of already fetched search pages, see
+    get_htmlelement_from_url()
+    """
     # HearthPwn assigns each class a "power of two" value for filtering by
     # class so that you can AND the values and filter by multiple classes.
     # Since we want to query each class individually (to get the same number
     # of results for each class), calculating powers of 2 works fine.
     classes = [2**x for x in range(2, 11)]
-    decks = []
+    decks_metainfo = []
 
     if not count:
         # Substitute a default count in here so that all classes return the
         # same number of decks. The default count is 10% of the total decks
         # for the current filtering/sorting/patch.
         url = generate_url(filtering, sorting, patch)
-        pagecount = get_pagecount(get_htmlelement_from_url(url))
+        pagecount = get_pagecount(get_htmlelement_from_url(url, cache)) or 1
         count = int((pagecount * DECKS_PER_PAGE * 0.1) / len(classes))
     for classid in classes:
-        decks += get_decks(filtering, sorting, count, patch, classid)
-    return decks
+        decks_metainfo += get_deck_metainfo(filtering, sorting, count, patch,
+                                            classid, cache)
+    return decks_metainfo
 
 
 def get_decks(filtering=None, sorting=None, count=None,
@@ -292,15 +498,32 @@ def get_decks(filtering=None, sorting=None, count=None,
     - 'classid' - the HearthPwn class ID used when finding decks, as seen in
     the HearthPwn URL after "&filter-class="
     """
-    decks_metainfo = get_deck_metainfo(filtering, sorting, count,
-                                       patch, classid)
+    return get_decks_from_metainfo(
+        get_deck_metainfo(filtering, sorting, count, patch, classid))
+
+
+def get_decks_from_metainfo(decks_metainfo, decklists=None):
+    """
+    Turn a list of deck metainfo from get_deck_metainfo() into a list of Deck
+    objects, retrieving the list of cards for each deck from HearthPwn.
 
+    Parameters:
+
+    - 'decks_metainfo' - a list of (links, classes, types, ratings, dusts,
+    epochs)
+    - 'decklists' - an optional dict of HearthPwn deck ID to an already
+    retrieved list of Cards
+    """
     decks = []
     total = len(decks_metainfo)
     for counter, deck in enumerate(decks_metainfo):
-        print("Adding deck " + str(counter+1) + " of " + str(total))
+        if decklists is not None and deck[0] in decklists:
+            decklist = decklists[deck[0]]
+        else:
+            print("Adding deck " + str(counter+1) + " of " + str(total))
+            decklist = get_deck_list(deck[0])
         decks += [Deck(deck[0], deck[1], deck[2], deck[3], deck[4], deck[5],
-                  get_deck_list(deck[0]))]
+                  decklist)]
 
     return decks
 
@@ -348,7 +571,7 @@ def get_deck_list(deckid):
     return deck
 
 
-def get_htmlelement_from_url(url):
+def get_htmlelement_from_url(url, cache=None):
     """
     Using requests and LXML's HTML module, retrieve a URL and return the page
     as an LXML HtmlElement.
@@ -356,9 +579,16 @@ def get_htmlelement_from_url(url):
     Parameters:
 
     - 'url' - the URL of the webpage to get
+    - 'cache' - an optional dict of URL to page text. Pages found in it
+    aren't fetched again, and fetched pages are added to it.
     """
-    response = requests.get(url)
-    htmlelement = html.fromstring(response.text)
+    if cache is not None and url in cache:
+        text = cache[url]
+    else:
+        text = requests.get(url).text
+        if cache is not None:
+            cache[url] = text
+    htmlelement = html.fromstring(text)
     return htmlelement
 
 
@@ -394,11 +624,17 @@ def get_latest_patch():
 
 def get_pagecount(htmlelement):
     """
-    Gets the total number of pages on a HearthPwn search from a htmlelement.
+    Gets the total number of pages on a HearthPwn search from a htmlelement,
+    or None if the page doesn't show it.
     """
     css = ('#content > section > div > div > div.listing-header >'
            'div.b-pagination.b-pagination-a > ul > li:nth-child(7) > a')
-    pagecount = htmlelement.cssselect(css)[0].text
+    elements = htmlelement.cssselect(css)
+    if not elements:
+        # Searches with only a few pages don't have a link to the last page.
+        print('Pagecount: unknown')
+        return None
+    pagecount = elements[0].text
     print('Pagecount: ' + pagecount)
     return int(pagecount)
 
@@ -480,7 +716,7 @@ def generate_url(filtering=None, sorting=None, patch=None, classid=None):
 
 
 def get_deck_metainfo(filtering=None, sorting=None, count=None,
-                      patch=None, classid=None):
+                      patch=None, classid=None, cache=None):
     """
     Gets a list of (links, classes, types, ratings, dusts, epochs)
     from HearthPwn using the provided paramters.
@@ -496,65 +732,118 @@ def get_deck_metainfo(filtering=None, sorting=None, count=None,
     HearthPwn URL after "&filter-build="
     - 'classid' - the HearthPwn class ID used when finding decks, as seen in
     the HearthPwn URL after "&filter-class="
+    - 'cache' - an optional dict of already fetched search pages, see
+    get_htmlelement_from_url()
     """
     url = generate_url(filtering, sorting, patch, classid)
+    # The first page doubles as the probe for the page count, so it's only
+    # fetched once.
+    firstpage = get_htmlelement_from_url(url, cache)
 
+    # Bounds the pages fetched ahead, even when a count is given.
+    pagecount = get_pagecount(firstpage)
     if not count:
-        # Get a 10% sampling of the pages for the current
-        # filtering/sorting/patch/classid
-        pagecount = get_pagecount(get_htmlelement_from_url(url))
-        count = int(pagecount * .1)
+        # Get a 10% sampling of the decks for the current
+        # filtering/sorting/patch/classid. Without a page count, the search
+        # is assumed to fit on one page.
+        count = int((pagecount or 1) * DECKS_PER_PAGE * .1)
 
-    pagecount = math.ceil(count / DECKS_PER_PAGE)
+    return get_deck_pages(url, firstpage, count, pagecount, cache)
 
-    regex = re.compile('^\s*\/decks\/(\d+)')
+
+def get_deck_pages(url, firstpage, count, pagecount=None, cache=None):
+    """
+    Collects deck metainfo from a HearthPwn search one page at a time,
+    starting with an already fetched first page. Up to PREFETCH_PAGES of the
+    following pages are fetched in the background while earlier pages are
+    being read, and no more pages are requested once 'count' decks have been
+    found or a short (last) page is reached.
+
+    Parameters:
+
+    - 'url' - the HearthPwn search URL, as returned by generate_url()
+    - 'firstpage' - the HtmlElement of the first page of the search
+    - 'count' - number of decks to retrieve
+    - 'pagecount' - the total number of pages, if known
+    - 'cache' - an optional dict of already fetched search pages, see
+    get_htmlelement_from_url()
+    """
     output = []
-    # Adding one as range is exclusive
-    for pagenum in range(1, int(pagecount)+1):
-
-        # For each page, get a list of decks from all of the href attributes.
-        # Then for each list of decks, pull out the deck ID using regex.
-        # Finally, if there is a match, append the deck ID to the deckids list.
-        page = ''
-        if pagenum > 1:
-            page = '&page=' + str(pagenum)
-
-        htmlelement = get_htmlelement_from_url(url + page)
-
-        # This CSS selector grabs all of the a (HTML hyperlink) elements in the
-        # HearthPwn decks table (being specific to make sure we get the right
-        # elements.) We can pull the deck IDs from the HREF attribute.
-        css = '#decks > tbody > tr > td.col-name > div > span > a'
-        links = htmlelement.cssselect(css)
-        css = '#decks > tbody > tr > td.col-deck-type > span'
-        decktypes = htmlelement.cssselect(css)
-        css = '#decks > tbody > tr > td.col-class'
-        heros = htmlelement.cssselect(css)
-        css = '#decks > tbody > tr > td.col-ratings > div'
-        ratings = htmlelement.cssselect(css)
-        css = '#decks > tbody > tr > td.col-dust-cost'
-        dusts = htmlelement.cssselect(css)
-        css = '#decks > tbody > tr > td.col-updated > abbr'
-        epochs = htmlelement.cssselect(css)
-
-        links = [link.attrib['href'] for link in links]
-        types = [decktype.text for decktype in decktypes]
-        classes = [hero.text for hero in heros]
-        ratings = [rating.text for rating in ratings]
-        dusts = [dust.text.replace(",", "").replace("k", "00").replace(".", "")
-                 for dust in dusts]
-        epochs = [epoch.attrib['data-epoch'] for epoch in epochs]
-
-        for x in range(len(links)):
-            match = re.search(regex, links[x])
-            links[x] = int(match.group(1))
-
-        output += list(zip(links, classes, types, ratings, dusts, epochs))
+    nextpage = 1
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=PREFETCH_PAGES) as executor:
+        htmlelement = firstpage
+        while True:
+            rows = get_deck_metainfo_from_page(htmlelement)
+            # Rows without a deck ID are skipped, but still count towards
+            # the page size when checking for the last page.
+            output += [row for row in rows if row[0] is not None]
+            if len(rows) < DECKS_PER_PAGE or len(output) >= count:
+                break
+
+            # Keep enough pages in flight to cover the decks still needed,
+            # assuming the remaining pages are full.
+            needed = math.ceil((count - len(output)) / DECKS_PER_PAGE)
+            while (len(pending) < min(needed, PREFETCH_PAGES) and
+                   (pagecount is None or nextpage < pagecount)):
+                nextpage += 1
+                pending.append(executor.submit(
+                    get_htmlelement_from_url,
+                    url + '&page=' + str(nextpage), cache))
+            if not pending:
+                break
+            htmlelement = pending.popleft().result()
+
+        for future in pending:
+            future.cancel()
 
     return output[:count]
 
 
-def populate_deck_db(decks, cursor):
+def get_deck_metainfo_from_page(htmlelement):
+    """
+    Gets a list of (links, classes, types, ratings, dusts, epochs) from a
+    single page of a HearthPwn search. The deck ID is None for any row where
+    it couldn't be found.
+
+    Parameters:
+
+    - 'htmlelement' - the HtmlElement of a HearthPwn search page
+    """
+    regex = re.compile('^\s*\/decks\/(\d+)')
+
+    # This CSS selector grabs all of the a (HTML hyperlink) elements in the
+    # HearthPwn decks table (being specific to make sure we get the right
+    # elements.) We can pull the deck IDs from the HREF attribute.
+    css = '#decks > tbody > tr > td.col-name > div > span > a'
+    links = htmlelement.cssselect(css)
+    css = '#decks > tbody > tr > td.col-deck-type > span'
+    decktypes = htmlelement.cssselect(css)
+    css = '#decks > tbody > tr > td.col-class'
+    heros = htmlelement.cssselect(css)
+    css = '#decks > tbody > tr > td.col-ratings > div'
+    ratings = htmlelement.cssselect(css)
+    css = '#decks > tbody > tr > td.col-dust-cost'
+    dusts = htmlelement.cssselect(css)
+    css = '#decks > tbody > tr > td.col-updated > abbr'
+    epochs = htmlelement.cssselect(css)
+
+    links = [link.attrib['href'] for link in links]
+    types = [decktype.text for decktype in decktypes]
+    classes = [hero.text for hero in heros]
+    ratings = [rating.text for rating in ratings]
+    dusts = [dust.text.replace(",", "").replace("k", "00").replace(".", "")
+             for dust in dusts]
+    epochs = [epoch.attrib['data-epoch'] for epoch in epochs]
+
+    for x in range(len(links)):
+        match = re.search(regex, links[x])
+        links[x] = int(match.group(1)) if match else None
+
+    return list(zip(links, classes, types, ratings, dusts, epochs))
+
+
+def populate_deck_db(decks, cursor, tag=None):
     """
     (Re)populates deck information in the SQLite database.
 
@@ -562,27 +851,206 @@ def populate_deck_db(decks, cursor):
 
     - 'decks' - a list of Deck objects
     - 'cursor' - a SQLite3 cursor object
+    - 'tag' - if set, the decks are stored in the decks_<tag> and
+    deck_lists_<tag> tables instead of decks and deck_lists
     """
-    cursor.execute('DROP TABLE IF EXISTS decks')
-    cursor.execute('DROP TABLE IF EXISTS deck_lists')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS decks
+    decks_table = 'decks'
+    deck_lists_table = 'deck_lists'
+    if tag:
+        decks_table += '_' + tag
+        deck_lists_table += '_' + tag
+    cursor.execute('DROP TABLE IF EXISTS ' + decks_table)
+    cursor.execute('DROP TABLE IF EXISTS ' + deck_lists_table)
+    cursor.execute('CREATE TABLE IF NOT EXISTS ' + decks_table + '''
              (deckid integer primary key, class text, type text,
              rating integer, dust integer, updated integer)''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS deck_lists
+    cursor.execute('CREATE TABLE IF NOT EXISTS ' + deck_lists_table + '''
              (deckid integer, cardname text, amount integer,
               PRIMARY KEY (deckid, cardname))''')
     for deck in decks:
-        cursor.execute('''INSERT INTO decks (class, type, rating, dust, updated)
+        cursor.execute('INSERT INTO ' + decks_table +
+                       ''' (class, type, rating, dust, updated)
                         VALUES ( ?, ?, ?, ?, ?)''',
                        (deck.hero, deck.type, deck.rating,
                         deck.dust, deck.updated))
         last_id = cursor.lastrowid
         for card in deck.decklist:
-            cursor.execute('INSERT INTO deck_lists VALUES (?, ?, ?)',
+            cursor.execute('INSERT INTO ' + deck_lists_table +
+                           ' VALUES (?, ?, ?)',
                            (last_id, card.cardname, card.amount))
     return
 
 
+def read_jobs(filename):
+    """
+    Reads a job file of crawl configurations, and returns them as a list of
+    dicts. Each section of the file is one job, and the section name is the
+    tag its decks are stored under. For example:
+
+    [top_rated]
+    sorting = -rating
+    count = 100
+
+    [latest_perclass]
+    perclass = yes
+    patch = 12345
+
+    Each job can set filtering, sorting, patch, count, and perclass, which
+    work the same as the matching command line arguments.
+
+    Parameters:
+
+    - 'filename' - the path of the job file
+    """
+    if not Path(filename).is_file():
+        print('Job file ' + filename + ' does not exist.')
+        sys.exit(-1)
+    # Interpolation is disabled, as HearthPwn filters can contain '%'.
+    jobconfig = configparser.ConfigParser(interpolation=None)
+    jobconfig.read(filename)
+    jobs = []
+    tags = {}
+    for tag in jobconfig.sections():
+        if not re.match(r'^\w+$', tag):
+            print('Job name ' + tag + ' can only contain letters, numbers,'
+                  ' and underscores.')
+            sys.exit(-1)
+        # SQLite table names aren't case sensitive, so these jobs would
+        # overwrite each other's tables.
+        if tag.lower() in tags:
+            print('Job names ' + tags[tag.lower()] + ' and ' + tag +
+                  ' only differ by case.')
+            sys.exit(-1)
+        tags[tag.lower()] = tag
+        section = jobconfig[tag]
+        for key in section:
+            if key not in JOB_OPTIONS:
+                print('Unknown setting ' + key + ' in job ' + tag + '. Jobs'
+                      ' can only set: ' + ', '.join(JOB_OPTIONS))
+                sys.exit(-1)
+        try:
+            jobs.append({'tag': tag,
+                         'filtering': section.get('filtering'),
+                         'sorting': section.get('sorting'),
+                         'patch': section.getint('patch'),
+                         'count': section.getint('count'),
+                         'perclass': section.getboolean('perclass', False)})
+        except ValueError as error:
+            print('Invalid setting in job ' + tag + ': ' + str(error))
+            sys.exit(-1)
+    return jobs
+
+
+def run_jobs(jobs, cursor):
+    """
+    Runs a list of crawl jobs from read_jobs() together, storing each job's
+    decks under its tag with populate_deck_db().
+
+    The search pages for every job are collected first, sharing one page
+    cache, so searches that overlap between jobs are only fetched once. The
+    lists of cards are then fetched once per unique deck, no matter how many
+    jobs found it.
+
+    Parameters:
+
+    - 'jobs' - a list of job dicts, as returned by read_jobs()
+    - 'cursor' - a SQLite3 cursor object
+    """
+    cache = {}
+    latest_patch = None
+    jobs_metainfo = []
+    for job in jobs:
+        print("Finding decks for job " + job['tag'] + "...")
+        patch = job['patch']
+        if not patch:
+            # Looked up once for all jobs, rather than once per search.
+            if not latest_patch:
+                latest_patch = get_latest_patch()
+            patch = latest_patch
+        if job['perclass']:
+            decks_metainfo = get_deck_metainfo_per_class(
+                job['filtering'], job['sorting'], job['count'], patch, cache)
+        else:
+            decks_metainfo = get_deck_metainfo(
+                job['filtering'], job['sorting'], job['count'], patch,
+                None, cache)
+        jobs_metainfo.append(decks_metainfo)
+
+    # Same order as found, minus duplicates.
+    deckids = list(dict.fromkeys(deck[0] for decks_metainfo in jobs_metainfo
+                                 for deck in decks_metainfo))
+    decklists = {}
+    total = len(deckids)
+    with ThreadPoolExecutor(max_workers=DECK_LIST_WORKERS) as executor:
+        for counter, (deckid, decklist) in enumerate(
+                zip(deckids, executor.map(get_deck_list, deckids))):
+            print("Adding deck " + str(counter+1) + " of " + str(total))
+            decklists[deckid] = decklist
+
+    for job, decks_metainfo in zip(jobs, jobs_metainfo):
+        print("Storing " + str(len(decks_metainfo)) + " decks for job " +
+              job['tag'])
+        populate_deck_db(get_decks_from_metainfo(decks_metainfo, decklists),
+                         cursor, job['tag'])
+    return
+
+
+def populate_craftability_db(cursor):
+    """
+    (Re)populates the missing cards and missing dust needed to build every
+    deck from your collection in the SQLite database. All decks are computed
+    in a single query rather than one query per deck.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    """
+    cursor.execute('DROP TABLE IF EXISTS temp.crafting_costs')
+    cursor.execute('''CREATE TEMP TABLE crafting_costs
+                      (rarity text, dust integer, PRIMARY KEY (rarity))''')
+    cursor.executemany('INSERT INTO crafting_costs VALUES (?, ?)',
+                       CRAFTING_COSTS.items())
+    cursor.execute('DROP TABLE IF EXISTS craftability')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS craftability
+                      (deckid integer primary key, missingcards integer,
+                       missingdust integer, unknowncards integer)''')
+    # The two-argument max() is SQLite's scalar max, clamping cards you own
+    # more of than the deck needs to zero missing. Missing cards without a
+    # known rarity (not in the cards table) can't be priced, so they're
+    # counted in unknowncards instead of missingdust, and those decks are
+    # listed last by --craftable.
+    cursor.execute('''
+            insert into craftability
+            select decks.deckid,
+                   coalesce(sum(max(deck_lists.amount -
+                                    coalesce(collection.amount, 0), 0)), 0),
+                   coalesce(sum(max(deck_lists.amount -
+                                    coalesce(collection.amount, 0), 0) *
+                                crafting_costs.dust), 0),
+                   coalesce(sum(case
+                                    when crafting_costs.dust is null
+                                    then max(deck_lists.amount -
+                                             coalesce(collection.amount, 0),
+                                             0)
+                                    else 0
+                                end), 0)
+            from decks
+            left join deck_lists
+            on decks.deckid = deck_lists.deckid
+            left join collection
+            on deck_lists.cardname = collection.cardname
+            left join cards
+            on deck_lists.cardname = cards.cardname
+            left join crafting_costs
+            on cards.rarity = crafting_costs.rarity
+            group by decks.deckid
+            ''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS craftability_missingdust
+                      ON craftability (missingdust, missingcards)''')
+    cursor.execute('DROP TABLE temp.crafting_costs')
+    return
+
+
 def get_cards(mashape_key):
     """
     Gets a list of all current Hearthstone cards from omgvamp's mashape
@@ -759,36 +1227,652 @@ def get_db_card_percentages(cursor):
 
     Parameters:
 
+    - 'cursor' - a SQLite3 cursor object
+    """
+    results = cursor.execute(CARD_PERCENTAGES_SQL)
+    return results
+
+
+def get_db_craftability(cursor):
+    """
+    For all decks, return: (deckid, class, type, rating, dust, missing cards,
+    missing dust, and missing cards of unknown rarity) from the database,
+    sorted by the dust missing to build the deck. Decks missing cards of
+    unknown rarity are sorted last, as their missing dust is incomplete.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    """
+    results = cursor.execute(CRAFTABILITY_SQL)
+    return results
+
+
+def get_db_card_stats(cursor):
+    """
+    Return the card percentages from the database as a list of dicts, using
+    the same column names as --results.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    """
+    keys = ('cardname', 'hero', 'totaldecks', 'avgperdeck',
+            'percentdecks', 'incollection')
+    return [dict(zip(keys, row)) for row in get_db_card_percentages(cursor)]
+
+
+def get_db_class_breakdown(cursor):
+    """
+    For each class, return the number of decks, average rating, and average
+    dust cost from the database as a list of dicts.
+
+    Parameters:
+
     - 'cursor' - a SQLite3 cursor object
     """
     sql = '''
-            select cards.cardname,
-                    cards.hero,
-                    case
-                        when deck_lists.cardname is null then 0
-                        else count(*)
-                    end as [total],
-                    avg(coalesce(deck_lists.amount, 0)) as [per deck],
-                    case
-                        when deck_lists.cardname is null then 0.0
-                        else count(*) /
-                        (select cast(count(*) as double) from decks) * 100.0
-                    end as [percent],
-                    coalesce(collection.amount, 0) as collected
-            from cards
-            left join deck_lists
-            on cards.cardname = deck_lists.cardname
-            left join collection
-            on cards.cardname = collection.cardname
-            where cards.cardset in ('Classic',
-                                    'Whispers of the Old Gods',
-                                    'Mean Streets of Gadgetzan',
-                                    'Journey to Un''Goro')
-            group by cards.cardname
-            order by Total desc
+            select class, count(*), avg(rating), avg(dust)
+            from decks
+            group by class
+            order by count(*) desc
             '''
-    results = cursor.execute(sql)
-    return results
+    keys = ('hero', 'decks', 'avgrating', 'avgdust')
+    return [dict(zip(keys, row)) for row in cursor.execute(sql)]
+
+
+def get_db_deck(cursor, deckid):
+    """
+    Return a deck and its list of cards from the database as a dict, or None
+    if the deck doesn't exist.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    - 'deckid' - the deck ID, as stored in the database
+    """
+    cursor.execute('''SELECT deckid, class, type, rating, dust, updated
+                      FROM decks WHERE deckid IS ?''', (deckid,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    keys = ('deckid', 'hero', 'type', 'rating', 'dust', 'updated')
+    deck = dict(zip(keys, row))
+    cursor.execute('''SELECT cardname, amount FROM deck_lists
+                      WHERE deckid IS ? ORDER BY cardname''', (deckid,))
+    deck['cards'] = [{'cardname': cardname, 'amount': amount}
+                     for cardname, amount in cursor.fetchall()]
+    return deck
+
+
+def get_export_sql(cursor, source):
+    """
+    Returns the SQL used to export a named query or a table.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    - 'source' - one of the names in EXPORT_QUERIES, or a table name
+    """
+    if source in EXPORT_QUERIES:
+        return EXPORT_QUERIES[source]
+    cursor.execute('SELECT name FROM sqlite_master '
+                   'WHERE type IS ? AND name IS ?', ('table', source))
+    if not cursor.fetchone():
+        print(source + ' is not a table or one of the named queries: ' +
+              ', '.join(EXPORT_QUERIES))
+        sys.exit(-1)
+    return 'SELECT * FROM "' + source + '"'
+
+
+def export_to_file(cursor, sql, output, outformat):
+    """
+    Runs a query and streams its rows to a CSV or JSON Lines file, returning
+    the number of rows written. Rows are read from the cursor
+    EXPORT_CHUNK_ROWS at a time and written through a large buffer, so memory
+    use doesn't grow with the size of the export. The file is written under a
+    temporary name and only renamed once the export succeeds.
+
+    Repeated column names (such as deckid from both sides of a join) are
+    renamed deckid_2, deckid_3, and so on, and BLOB values are written to
+    JSON Lines as base64 strings.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    - 'sql' - the query to export
+    - 'output' - the path of the file to write, or an already open file
+    (such as sys.stdout) to write to
+    - 'outformat' - either 'csv' or 'jsonl'
+    """
+    # Exports are only meant to read the database, so any query that tries
+    # to change it fails instead.
+    cursor.execute('PRAGMA query_only = ON')
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.connection.execute('PRAGMA query_only = OFF')
+    if cursor.description is None:
+        print('Unable to export: the query doesn\'t return any rows.')
+        sys.exit(-1)
+    columns = get_export_columns(cursor)
+    if isinstance(output, str):
+        tempname = output + '.tmp'
+        outfile = open(tempname, 'w', newline='', encoding='UTF-8',
+                       buffering=EXPORT_BUFFER_SIZE)
+    else:
+        outfile = output
+    rowcount = 0
+    completed = False
+    try:
+        if outformat == 'csv':
+            writer = csv.writer(outfile)
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            if outformat == 'csv':
+                writer.writerows(rows)
+            else:
+                outfile.write(''.join(json.dumps(dict(zip(columns, row)),
+                                                 default=encode_blob) + '\n'
+                                      for row in rows))
+            rowcount += len(rows)
+        completed = True
+    finally:
+        if outfile is output:
+            outfile.flush()
+        else:
+            outfile.close()
+            if completed:
+                os.replace(tempname, output)
+            else:
+                os.remove(tempname)
+    return rowcount
+
+
+def get_export_columns(cursor):
+    """
+    Returns the column names of a query's results, renaming any repeated
+    names by adding _2, _3, and so on, so that every name is unique.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object that has just run a query
+    """
+    names = [column[0] for column in cursor.description]
+    columns = []
+    for name in names:
+        unique = name
+        suffix = 2
+        # Also avoid names used by later columns, so that a column already
+        # named deckid_2 is never duplicated either.
+        while unique in columns or (unique != name and unique in names):
+            unique = name + '_' + str(suffix)
+            suffix += 1
+        columns.append(unique)
+    return columns
+
+
+def encode_blob(value):
+    """
+    Used by json.dumps() to encode values it doesn't support. SQLite BLOBs
+    are returned as base64 strings.
+
+    Parameters:
+
+    - 'value' - the value json.dumps() couldn't encode
+    """
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError('Unable to export values of type ' +
+                    type(value).__name__)
+
+
+def export_to_sqlite(cursor, sql, output, name):
+    """
+    Runs a query and copies its rows into a table in another SQLite database,
+    returning the number of rows copied. The other database is attached to
+    the connection, so the rows are copied by SQLite without passing through
+    Python.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    - 'sql' - the query to export
+    - 'output' - the path of the SQLite database to copy the rows into
+    - 'name' - the name of the table to (re)create in that database
+    """
+    created = not Path(output).exists()
+    cursor.execute('ATTACH DATABASE ? AS export', (output,))
+    completed = False
+    try:
+        # The rows are copied into a new table first, so the old table is
+        # only replaced once the query has succeeded.
+        cursor.execute('DROP TABLE IF EXISTS export."' + name + '_new"')
+        cursor.execute('CREATE TABLE export."' + name + '_new" AS ' + sql)
+        cursor.execute('DROP TABLE IF EXISTS export."' + name + '"')
+        cursor.execute('ALTER TABLE export."' + name + '_new" RENAME TO "' +
+                       name + '"')
+        cursor.execute('SELECT count(*) FROM export."' + name + '"')
+        rowcount = cursor.fetchone()[0]
+        cursor.connection.commit()
+        completed = True
+    finally:
+        cursor.execute('DETACH DATABASE export')
+        if created and not completed and Path(output).exists():
+            # Don't leave behind an empty database that ATTACH created.
+            os.remove(output)
+    return rowcount
+
+
+def export_snapshot(cursor, path):
+    """
+    Exports the decks, deck_lists, and cards tables to a directory of
+    columnar binary files that can be memory-mapped with load_snapshot().
+
+    Each export is written to a new build directory inside 'path', named
+    after the time it started. Once every file is written, the 'CURRENT'
+    file is switched to name the new build, so readers always see one
+    complete build. The build before it is kept for readers that are still
+    loading it, and any older builds are deleted.
+
+    In a build, each column is written to '<table>.<column>.npy' in NumPy's
+    .npy format, so the files can also be opened with
+    numpy.load(..., mmap_mode='r'). Text columns are stored as indexes into
+    'strings.json'. 'snapshot.json' lists the tables, columns, and row
+    counts.
+
+    Parameters:
+
+    - 'cursor' - a SQLite3 cursor object
+    - 'path' - the directory to write the snapshot to
+    """
+    directory = Path(path)
+    directory.mkdir(exist_ok=True)
+    previous = get_snapshot_build(directory)
+    build = str(time.time_ns())
+    builddir = directory / build
+    builddir.mkdir()
+    strings = {}
+    manifest = {}
+    for table in SNAPSHOT_TABLES:
+        cursor.execute('SELECT name FROM sqlite_master '
+                       'WHERE type IS ? AND name IS ?', ('table', table))
+        if not cursor.fetchone():
+            print('Table ' + table + ' does not exist, skipping.')
+            continue
+        columns = [(row[1], row[2].lower())
+                   for row in cursor.execute('PRAGMA table_info(' + table +
+                                             ')')]
+        arrays = [array.array(get_array_typecode(SNAPSHOT_TYPES[coltype]))
+                  for name, coltype in columns]
+        sql = ('SELECT ' + ', '.join(name for name, coltype in columns) +
+               ' FROM ' + table + ' ORDER BY rowid')
+        for row in cursor.execute(sql):
+            for x, value in enumerate(row):
+                if columns[x][1] == 'text':
+                    # NULL strings are stored as -1.
+                    if value is None:
+                        value = -1
+                    else:
+                        value = strings.setdefault(value, len(strings))
+                elif value is None:
+                    value = 0
+                arrays[x].append(value)
+        for (name, coltype), values in zip(columns, arrays):
+            write_npy(builddir / (table + '.' + name + '.npy'), values,
+                      SNAPSHOT_TYPES[coltype])
+        manifest[table] = {'rows': len(arrays[0]),
+                           'columns': dict(columns)}
+
+    # Strings are numbered in insertion order, which dicts preserve.
+    (builddir / 'strings.json').write_text(json.dumps(list(strings)))
+    (builddir / 'snapshot.json').write_text(json.dumps(manifest, indent=4))
+
+    write_file_atomic(directory / 'CURRENT', build.encode('UTF-8'))
+    for olddir in directory.iterdir():
+        if (olddir.is_dir() and olddir.name.isdigit() and
+                olddir.name not in (build, previous)):
+            shutil.rmtree(str(olddir))
+    return
+
+
+def get_snapshot_build(directory):
+    """
+    Returns the name of the current build of a snapshot, or None if the
+    snapshot hasn't been exported yet.
+
+    Parameters:
+
+    - 'directory' - the Path of the snapshot directory
+    """
+    current = directory / 'CURRENT'
+    if not current.is_file():
+        return None
+    return current.read_text().strip()
+
+
+def write_npy(filename, values, descr):
+    """
+    Writes an array.array to a file in NumPy's .npy (version 1.0) format.
+
+    Parameters:
+
+    - 'filename' - the Path of the file to write
+    - 'values' - an array.array of numbers
+    - 'descr' - the little-endian NumPy dtype of the array, such as '<i8'
+    """
+    if values.itemsize != int(descr[2:]):
+        raise ValueError('Array of ' + str(values.itemsize) + ' byte values '
+                         'does not match dtype ' + descr)
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    header = ("{'descr': '" + descr + "', 'fortran_order': False, "
+              "'shape': (" + str(len(values)) + ",), }")
+    # The header is padded with spaces (and ends in a newline) so that the
+    # data starts on a 64 byte boundary, as the .npy format requires.
+    padding = 64 - (len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = (header + ' ' * (padding % 64) + '\n').encode('latin1')
+    filename.write_bytes(NPY_MAGIC + len(header).to_bytes(2, 'little') +
+                         header + values.tobytes())
+    return
+
+
+def write_file_atomic(filename, data):
+    """
+    Writes data to a temporary file, then moves it over the given filename,
+    so that readers see either the old or the new file, never part of one.
+
+    Parameters:
+
+    - 'filename' - the Path of the file to write
+    - 'data' - the bytes to write
+    """
+    temp = filename.with_name(filename.name + '.tmp')
+    temp.write_bytes(data)
+    os.replace(str(temp), str(filename))
+    return
+
+
+def load_snapshot(path):
+    """
+    Memory-maps the current build of a snapshot written by export_snapshot(),
+    and returns a tuple of (tables, strings). 'tables' maps each table name
+    to a dict of column name to memoryview of the column's values, which are
+    read directly from the mapped file without copying. Text columns hold
+    indexes into the 'strings' list (or -1 for NULL).
+
+    Parameters:
+
+    - 'path' - the directory the snapshot was written to
+    """
+    build = get_snapshot_build(Path(path))
+    if not build:
+        raise FileNotFoundError('No snapshot has been exported to ' +
+                                str(path))
+    directory = Path(path) / build
+    manifest = json.loads((directory / 'snapshot.json').read_text())
+    strings = json.loads((directory / 'strings.json').read_text())
+    tables = {}
+    for table, info in manifest.items():
+        tables[table] = {}
+        for name in info['columns']:
+            filename = directory / (table + '.' + name + '.npy')
+            values = load_npy(filename)
+            if len(values) != info['rows']:
+                raise ValueError(str(filename) + ' has ' + str(len(values)) +
+                                 ' rows, but the snapshot has ' +
+                                 str(info['rows']))
+            tables[table][name] = values
+    return tables, strings
+
+
+def load_npy(filename):
+    """
+    Memory-maps a one dimensional .npy file written by write_npy(), and
+    returns its values as a read-only memoryview.
+
+    Parameters:
+
+    - 'filename' - the Path of the file to load
+    """
+    with open(str(filename), 'rb') as npyfile:
+        mapped = mmap.mmap(npyfile.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(NPY_MAGIC)] != NPY_MAGIC:
+        raise ValueError(str(filename) + ' is not a .npy file')
+    headerlength = int.from_bytes(mapped[8:10], 'little')
+    header = ast.literal_eval(mapped[10:10 + headerlength].decode('latin1'))
+    if (sys.byteorder == 'big' or
+            header['descr'] not in SNAPSHOT_TYPES.values()):
+        raise ValueError(str(filename) + ' has unsupported type ' +
+                         header['descr'])
+    # The mmap stays open for as long as the memoryview is referenced.
+    return memoryview(mapped)[10 + headerlength:].cast(
+        get_array_typecode(header['descr']))
+
+
+def get_array_typecode(descr):
+    """
+    Returns the array module typecode for a little-endian NumPy integer
+    dtype such as '<i8'. The size of each typecode depends on the platform,
+    so the typecode is picked by its size rather than fixed.
+
+    Parameters:
+
+    - 'descr' - the NumPy dtype, as stored in a .npy header
+    """
+    size = int(descr[2:])
+    for typecode in ('b', 'h', 'i', 'l', 'q'):
+        if array.array(typecode).itemsize == size:
+            return typecode
+    raise ValueError('No array typecode is ' + str(size) + ' bytes')
+
+
+class StatsCache:
+
+    """
+    A thread-safe, in-memory cache of encoded HTTP responses, invalidated
+    whenever the SQLite database is written to.
+    """
+
+    def __init__(self, dbpath):
+        """
+        Initialize a StatsCache object.
+
+        Parameters:
+
+        - 'dbpath' - the path of the SQLite database the responses come from
+        """
+        self.dbpath = dbpath
+        self.version = None
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def get_version(self):
+        """
+        Return a value that changes every time a build commits to the
+        database. SQLite rewrites the database file on commit, so the file's
+        modification time is enough to tell when a build has finished.
+
+        Parameters:
+
+        - 'self' - the StatsCache object calling this function
+        """
+        return os.stat(self.dbpath).st_mtime_ns
+
+    def get(self, path, build):
+        """
+        Return the cached response for a path, calling build() to create it
+        if it isn't cached or the database has changed since it was cached.
+
+        Parameters:
+
+        - 'self' - the StatsCache object calling this function
+        - 'path' - the request path used as the cache key
+        - 'build' - a function returning the (status, body) for the path
+        """
+        version = self.get_version()
+        with self.lock:
+            if version != self.version:
+                self.responses = {}
+                self.version = version
+            if path in self.responses:
+                return self.responses[path]
+        # Built outside of the lock so that slow queries don't block readers
+        # of other (already cached) paths.
+        response = build()
+        with self.lock:
+            # Only keep the response if no build finished while we were
+            # querying, otherwise it may already be stale.
+            if version == self.version and response[0] == 200:
+                self.responses[path] = response
+        return response
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+
+    """
+    Answers GET requests for card statistics, deck lookups, and class
+    breakdowns with JSON read from the SQLite database.
+
+    - /cards        - card usage statistics (same as --results)
+    - /classes      - deck count, average rating, and average dust per class
+    - /decks/<id>   - a single deck and its list of cards
+    """
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        status, body = self.server.cache.get(path,
+                                             lambda: self.build_response(path))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Logging every request to stderr slows down the server considerably
+        # at high request rates, so it is skipped.
+        return
+
+    def build_response(self, path):
+        """
+        Query the database for a path, and return a (status, body) tuple
+        where the body is the JSON encoded result.
+
+        Parameters:
+
+        - 'self' - the StatsRequestHandler object calling this function
+        - 'path' - the request path, without any query string
+        """
+        conn = self.server.acquire_connection()
+        cursor = conn.cursor()
+        match = re.match(r'^/decks/(\d+)$', path)
+        try:
+            if path == '/cards':
+                status, result = 200, get_db_card_stats(cursor)
+            elif path == '/classes':
+                status, result = 200, get_db_class_breakdown(cursor)
+            elif match:
+                result = get_db_deck(cursor, int(match.group(1)))
+                if result:
+                    status = 200
+                else:
+                    status, result = 404, {'error': 'Deck not found'}
+            else:
+                status, result = 404, {'error': 'Unknown path ' + path}
+        except sqlite3.OperationalError as error:
+            # Most likely a table that hasn't been built yet.
+            status, result = 503, {'error': str(error)}
+        finally:
+            cursor.close()
+            self.server.release_connection(conn)
+        return status, json.dumps(result).encode('UTF-8')
+
+
+class StatsServer(ThreadingHTTPServer):
+
+    """
+    A threaded HTTP server that shares a pool of read-only connections to the
+    SQLite database, and one response cache, between its request threads.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, dbpath):
+        """
+        Initialize a StatsServer object.
+
+        Parameters:
+
+        - 'address' - a (host, port) tuple to listen on
+        - 'dbpath' - the path of the SQLite database to serve
+        """
+        super().__init__(address, StatsRequestHandler)
+        self.dburi = Path(dbpath).resolve().as_uri() + '?mode=ro'
+        self.cache = StatsCache(dbpath)
+        self.connections = queue.LifoQueue()
+
+    def acquire_connection(self):
+        """
+        Return an idle read-only SQLite connection from the pool, opening a
+        new one if every connection is in use.
+
+        Parameters:
+
+        - 'self' - the StatsServer object calling this function
+        """
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            # A new thread is started for every request, so connections are
+            # opened here without thread checks and handed between threads.
+            return sqlite3.connect(self.dburi, uri=True,
+                                   check_same_thread=False)
+
+    def release_connection(self, conn):
+        """
+        Return a SQLite connection to the pool once a request is done with it.
+
+        Parameters:
+
+        - 'self' - the StatsServer object calling this function
+        - 'conn' - a connection from acquire_connection()
+        """
+        self.connections.put(conn)
+
+    def server_close(self):
+        super().server_close()
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+def serve_stats(dbpath, port):
+    """
+    Serve statistics from the SQLite database as JSON over HTTP until
+    interrupted.
+
+    Parameters:
+
+    - 'dbpath' - the path of the SQLite database to serve
+    - 'port' - the port to listen on
+    """
+    if not Path(dbpath).is_file():
+        print('Database ' + dbpath + ' does not exist.')
+        sys.exit(-1)
+    server = StatsServer(('127.0.0.1', port), dbpath)
+    print('Serving stats on http://127.0.0.1:' + str(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopping server')
+    finally:
+        server.server_close()
+    return
+
 
 if __name__ == "__main__":
     # Execute only if run as a script